@@ -1,26 +1,153 @@
 # 📊 E-Commerce Data Analysis with Streamlit
 # Author: Ayesha Arshad
 # -------------------------------------------
+import csv
+from pathlib import Path
+
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+
+try:
+    import numba  # optional: jitted groupby sums and top-k reducer
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 st.set_page_config(layout="wide", page_title="E-Commerce EDA")
 
 # ---------- Helpers ----------
-@st.cache_data
+# kwargs for groupby sums: jitted parallel kernel when numba is installed
+SUM_ENGINE = {"engine": "numba", "engine_kwargs": {"nopython": True, "parallel": True}} if HAS_NUMBA else {}
+
+# compact dtypes for known columns (applied only when the column is present);
+# money inputs stay float64 so the sales totals match to the cent
+CSV_DTYPES = {
+    "customer_id": "int32",
+    "product_id": "int32",
+    "quantity": "int16",
+    "price": "float64",
+    "discount": "float64",
+    "category": "category",
+}
+
+# the same schema for pyarrow's CSV reader (keys are normalized column names)
+ARROW_TYPES = {
+    "order_date": pa.timestamp("ns"),
+    "customer_id": pa.int32(),
+    "product_id": pa.int32(),
+    "quantity": pa.int16(),
+    "price": pa.float64(),
+    "discount": pa.float64(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+}
+
+# columns the dashboard reads or previews; anything else is dropped after preparation
+DASHBOARD_COLUMNS = (
+    "order_id", "order_date", "year_month", "customer_id", "product_id", "productname",
+    "category", "region", "payment_method", "quantity", "price", "discount", "sales",
+)
+
+# common names for the order date column (first match wins)
+DATE_CANDIDATES = ["order_date", "order date", "date", "orderdate"]
+
+# repeated keys stored as Categorical so filters and groupbys work on int codes
+CATEGORICAL_COLUMNS = ("category", "payment_method", "region", "customer_id", "product_id", "productname")
+
+def arrow_convert_options(csv_path):
+    """ConvertOptions typing the CSV's own header names via ARROW_TYPES."""
+    with open(csv_path, encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    column_types = {
+        c: ARROW_TYPES[c.strip().lower()] for c in header if c.strip().lower() in ARROW_TYPES
+    }
+    return pacsv.ConvertOptions(column_types=column_types)
+
+def read_csv_typed(csv_path):
+    """Parse CSV with pyarrow's multi-threaded reader using ARROW_TYPES.
+
+    Falls back to pandas' default parser when a typed column does not convert
+    (e.g. a non-ISO date or a missing id).
+    """
+    try:
+        table = pacsv.read_csv(csv_path, convert_options=arrow_convert_options(csv_path))
+    except pa.ArrowInvalid:
+        return pd.read_csv(csv_path)
+    return table.to_pandas()
+
+def fits_int(series, dtype):
+    """True unless series is integer-valued with values outside dtype's range."""
+    if not pd.api.types.is_integer_dtype(series) or series.empty:
+        return True
+    info = np.iinfo(dtype)
+    return info.min <= series.min() and series.max() <= info.max
+
+def compact_dtypes(df):
+    """Apply CSV_DTYPES and sorted Categoricals to the known columns present."""
+    for col, dtype in CSV_DTYPES.items():
+        if col in df.columns:
+            if dtype.startswith("int") and not fits_int(df[col], dtype):
+                # narrowing would wrap (e.g. quantity 40000 -> -25536); keep it wider
+                continue
+            try:
+                df[col] = df[col].astype(dtype)
+            except (TypeError, ValueError):
+                # e.g. missing values in an int column: take the smallest dtype that fits.
+                # Non-numeric values (ids like "C001") are left for the Categorical pass.
+                if dtype != "category" and pd.api.types.is_numeric_dtype(df[col]):
+                    downcast = "integer" if dtype.startswith("int") else "float"
+                    df[col] = pd.to_numeric(df[col], errors="coerce", downcast=downcast)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            # sorted levels, also for dictionary columns read in first-seen order
+            cat = df[col].astype("category").cat
+            df[col] = cat.reorder_categories(sorted(cat.categories))
+    return df
+
 def load_df(path="ecommerce_dataset.csv"):
-    """Load CSV and normalize column names to lowercase, return df."""
-    df = pd.read_csv(path)
+    """Load CSV and normalize column names to lowercase, return df.
+
+    The parsed frame is cached as Parquet next to the CSV, so later cold starts
+    skip CSV parsing. The cache is rebuilt whenever the CSV is newer.
+    """
+    csv_path = Path(path)
+    parquet_path = csv_path.with_suffix(".parquet")
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        # Parquet keeps string Categoricals but not int-valued ones, so re-apply
+        return compact_dtypes(pd.read_parquet(parquet_path))
+
+    df = read_csv_typed(csv_path)
     # normalize columns to lowercase and strip spaces
     df.columns = [c.strip().lower() for c in df.columns]
+    df = compact_dtypes(df)
+    # columns as found in the file, before order_date is derived; attrs are
+    # stored in the Parquet cache, so a cache hit reports the same list
+    df.attrs["detected_columns"] = list(df.columns)
+    # parse the order date here, once, so reruns and the Parquet cache get datetime64
+    df = safe_to_datetime(df, DATE_CANDIDATES, new_col="order_date")
+    tmp_path = parquet_path.with_name(parquet_path.name + ".tmp")
+    try:
+        # write aside and rename, so a crash never leaves a partial file that looks fresh
+        df.to_parquet(tmp_path, compression="zstd")
+        tmp_path.replace(parquet_path)
+    except Exception:
+        # cache is best effort (e.g. read-only folder); keep the parsed df
+        tmp_path.unlink(missing_ok=True)
     return df
 
 def safe_to_datetime(df, candidates, new_col="order_date"):
     """Find a date column from candidates and create standard order_date col."""
     for c in candidates:
         if c in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[c]):
+                # already parsed (pyarrow reader or Parquet cache): nothing to convert
+                df[new_col] = df[c]
+                return df
             try:
                 df[new_col] = pd.to_datetime(df[c], errors="coerce")
                 return df
@@ -30,11 +157,26 @@ def safe_to_datetime(df, candidates, new_col="order_date"):
     df[new_col] = pd.NaT
     return df
 
+# year_month value for rows without a valid order_date
+MISSING_MONTH = np.iinfo(np.int32).min
+
+def month_key(dates):
+    """Months since 1970-01 as int32 (NaT -> MISSING_MONTH)."""
+    months = dates.to_numpy("datetime64[ns]").astype("datetime64[M]")
+    key = months.astype(np.int64)
+    key[np.isnat(months)] = MISSING_MONTH
+    return key.astype(np.int32)
+
+def month_label(keys):
+    """Inverse of month_key for plotting: 'YYYY-MM' strings."""
+    months = np.datetime64("1970-01", "M") + np.asarray(keys).astype("timedelta64[M]")
+    return np.datetime_as_string(months, unit="M")
+
 def compute_sales(df):
     """Create Sales column if not present. Prefer existing 'sales', else compute."""
     if "sales" in df.columns:
         # ensure numeric
-        df["sales"] = pd.to_numeric(df["sales"], errors="coerce").fillna(0)
+        df["sales"] = pd.to_numeric(df["sales"], errors="coerce").fillna(0).astype(np.float64)
         return df
     # expected components: quantity, price, discount (discount as fraction or percent)
     q = None
@@ -52,32 +194,281 @@ def compute_sales(df):
             d = d / 100.0
     # Build Sales
     if q is not None and p is not None:
+        # float64 kernel (float32 products lose cents in the totals), with
+        # in-place steps instead of full-length temporaries
+        sales = np.multiply(q.to_numpy(np.float64), p.to_numpy(np.float64))
         if d is not None:
-            df["sales"] = q * p * (1 - d)
-        else:
-            df["sales"] = q * p
+            keep = np.subtract(1.0, d.to_numpy(np.float64))
+            np.multiply(sales, keep, out=sales)
+        df["sales"] = sales
     else:
         # Fallback: try order_total or amount fields
         for fallback in ["order_total", "amount", "total"]:
             if fallback in df.columns:
-                df["sales"] = pd.to_numeric(df[fallback], errors="coerce").fillna(0)
+                df["sales"] = pd.to_numeric(df[fallback], errors="coerce").fillna(0).astype(np.float64)
                 break
         else:
             # As last resort zero sales
-            df["sales"] = 0.0
+            df["sales"] = np.zeros(len(df), dtype=np.float64)
     return df
 
 def safe_groupby_sum(df, by, col="sales"):
+    """Sum col per group of by as a float64 Series (empty if by is missing)."""
     if by not in df.columns:
-        return pd.DataFrame(columns=[by, col])
-    g = df.groupby(by)[col].sum().reset_index()
-    return g
+        return pd.Series(dtype="float64", name=col)
+    # sum a float64 view: Cython keeps float32 sums in float32, numba returns float64
+    values = df[col].astype(np.float64)
+    return values.groupby(df[by], observed=True, sort=False).sum(**SUM_ENGINE)
+
+if HAS_NUMBA:
+    @numba.njit
+    def _code_totals(codes, values, ngroups):
+        """Single pass: per-code sum and row count (code -1 = missing, skipped)."""
+        totals = np.zeros(ngroups, dtype=np.float64)
+        counts = np.zeros(ngroups, dtype=np.int64)
+        for i in range(codes.size):
+            c = codes[i]
+            if c >= 0:
+                totals[c] += values[i]
+                counts[c] += 1
+        return totals, counts
+else:
+    def _code_totals(codes, values, ngroups):
+        """Per-code sum and row count with np.bincount (code -1 = missing, skipped)."""
+        if (codes < 0).any():
+            keep = codes >= 0
+            codes, values = codes[keep], values[keep]
+        # bincount yields int64 for empty input; keep totals float like the numba kernel
+        totals = np.bincount(codes, weights=values, minlength=ngroups).astype(np.float64, copy=False)
+        counts = np.bincount(codes, minlength=ngroups)
+        return totals, counts
+
+def top_k_indices(totals, k):
+    """Positions of the k largest totals, largest first.
+
+    argpartition selects them in O(n); only those k are then sorted.
+    """
+    k = min(k, totals.size)
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    idx = np.argpartition(-totals, k - 1)[:k]
+    return idx[np.argsort(-totals[idx], kind="stable")]
+
+def top_sales(df, by, k=10, col="sales"):
+    """Top k groups of by ranked by summed col, as a DataFrame (largest first)."""
+    if isinstance(df[by].dtype, pd.CategoricalDtype):
+        cat = df[by].cat
+        # codes are int8/16/32 depending on the category count, and int32 codes
+        # would come back as a read-only view; always take a writable int32 copy
+        # so every call hits the one numba signature warm_sum_engine compiles
+        codes = cat.codes.to_numpy().astype(np.int32)
+        totals, counts = _code_totals(codes, df[col].to_numpy(np.float64), len(cat.categories))
+        # groups without rows never rank (same as observed=True)
+        totals[counts == 0] = -np.inf
+        idx = top_k_indices(totals, min(k, int(np.count_nonzero(counts))))
+        return pd.DataFrame({by: cat.categories.take(idx), col: totals[idx]})
+    totals = safe_groupby_sum(df, by, col)
+    return totals.iloc[top_k_indices(totals.to_numpy(), k)].reset_index()
+
+def count_unique(series):
+    """Distinct non-missing values; for Categoricals, counted from the int codes."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        present = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        return int(np.count_nonzero(present))
+    return series.nunique()
+
+def code_crosstab(df, rows, cols, col="sales"):
+    """Sum col per (rows, cols) pair of Categorical codes, keeping observed levels only.
+
+    Returns (grid, row_labels, col_labels) ready for a heatmap.
+    """
+    r_cat, c_cat = df[rows].cat, df[cols].cat
+    ri, ci = r_cat.codes.to_numpy(), c_cat.codes.to_numpy()
+    keep = (ri >= 0) & (ci >= 0)
+    flat = ri[keep].astype(np.int64) * len(c_cat.categories) + ci[keep]
+    size = len(r_cat.categories) * len(c_cat.categories)
+    grid = np.bincount(flat, weights=df[col].to_numpy()[keep], minlength=size)
+    seen = np.bincount(flat, minlength=size) > 0
+    shape = (len(r_cat.categories), len(c_cat.categories))
+    grid, seen = grid.reshape(shape), seen.reshape(shape)
+    row_seen, col_seen = seen.any(axis=1), seen.any(axis=0)
+    return grid[row_seen][:, col_seen], r_cat.categories[row_seen], c_cat.categories[col_seen]
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def px_figure_json(kind, data, layout=None, **px_kwargs):
+    """Build px.<kind> from plain column tuples and return the figure as JSON."""
+    fig = getattr(px, kind)(pd.DataFrame(data), **px_kwargs)
+    if layout:
+        fig.update_layout(**layout)
+    return fig.to_json(validate=False)
+
+def plot_cached(kind, frame, layout=None, **px_kwargs):
+    """Render a plotly.express chart, reusing the cached JSON when its data is unchanged."""
+    # tuples of Python scalars keep the cache key cheap to hash (no DataFrame hashing)
+    data = {c: tuple(frame[c].tolist()) for c in frame.columns}
+    spec = px_figure_json(kind, data, layout, **px_kwargs)
+    st.plotly_chart(pio.from_json(spec), use_container_width=True)
+
+@st.cache_resource
+def warm_sum_engine():
+    """Compile the numba kernels on a 1-row frame so users don't wait for the JIT."""
+    if HAS_NUMBA:
+        dummy = pd.DataFrame({"key": pd.Categorical(["x"]), "sales": np.zeros(1, dtype=np.float64)})
+        safe_groupby_sum(dummy, "key")
+        top_sales(dummy, "key")
+
+def isin_mask(series, selected):
+    """Boolean array of rows whose value is in selected (compares Categorical codes)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        wanted = series.cat.categories.get_indexer(list(selected))
+        return np.isin(series.cat.codes.to_numpy(), wanted[wanted >= 0])
+    return series.isin(selected).to_numpy()
+
+def date_mask(df, date_range):
+    """Rows inside the selected order_date range, or None when no range is set."""
+    if date_range and isinstance(date_range, (list, tuple)) and len(date_range) == 2:
+        start, end = date_range
+        # convert to datetime; the end date is inclusive, so compare against the next midnight
+        start = pd.to_datetime(start)
+        end = pd.to_datetime(end) + pd.Timedelta(days=1)
+        return ((df["order_date"] >= start) & (df["order_date"] < end)).to_numpy()
+    return None
+
+def key_mask(df, cats, regions, payments):
+    """Rows matching the category / region / payment method selections."""
+    mask = np.ones(len(df), dtype=bool)
+    if cats:
+        mask &= isin_mask(df["category"], cats)
+    if regions:
+        mask &= isin_mask(df["region"], regions)
+    if payments:
+        mask &= isin_mask(df["payment_method"], payments)
+    return mask
+
+def filtered_rows(df, mask, columns=None, limit=None):
+    """Rows selected by a packed mask (None = all rows), only the given columns.
+
+    Copies just the columns a section plots and, with limit, just the first
+    matching rows, instead of materializing the whole filtered frame.
+    """
+    if columns is not None:
+        df = df[list(columns)]
+    if mask is None:
+        return df if limit is None else df.head(limit)
+    rows = np.flatnonzero(np.unpackbits(mask, count=len(df)))
+    return df.iloc[rows if limit is None else rows[:limit]]
+
+# largest month x filter-key cube precomputed for the monthly trend
+MAX_CUBE_CELLS = 5_000_000
+
+@st.cache_resource(show_spinner=False)
+def monthly_cube(_df, dims):
+    """Full-data sales and row counts per (month, *dims codes), or None if unavailable.
+
+    Each dim axis has one extra trailing slot for rows with a missing value, so
+    the unfiltered totals still include them. Computed once per process and
+    shared, not pickled per call (it can reach ~80MB); callers only read it.
+    The filtered monthly trend is then a slice-and-sum of this dense array.
+    """
+    months_all = _df["year_month"].to_numpy()
+    valid = months_all != MISSING_MONTH
+    months, flat = np.unique(months_all[valid], return_inverse=True)
+    if months.size == 0:
+        # no parsed order dates: let the caller fall back to the groupby
+        return None
+    shape = [len(months)]
+    flat = flat.astype(np.int64)
+    for c in dims:
+        n = len(_df[c].cat.categories)
+        codes = _df[c].cat.codes.to_numpy()[valid].astype(np.int64)
+        flat = flat * (n + 1) + np.where(codes < 0, n, codes)
+        shape.append(n + 1)
+    size = int(np.prod(shape))
+    if size > MAX_CUBE_CELLS:
+        return None
+    sales = np.bincount(flat, weights=_df["sales"].to_numpy()[valid], minlength=size).reshape(shape)
+    counts = np.bincount(flat, minlength=size).reshape(shape)
+    return months, sales, counts
+
+def monthly_from_cube(df, selections):
+    """Monthly sales for the key selections, sliced from monthly_cube (None if unavailable)."""
+    dims = tuple(c for c in selections if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype))
+    if any(selections[c] for c in selections if c not in dims):
+        return None
+    cube = monthly_cube(df, dims)
+    if cube is None:
+        return None
+    months, sales, counts = cube
+    for axis, c in enumerate(dims, start=1):
+        if selections[c]:
+            wanted = df[c].cat.categories.get_indexer(list(selections[c]))
+            wanted = wanted[wanted >= 0]
+            sales, counts = np.take(sales, wanted, axis=axis), np.take(counts, wanted, axis=axis)
+    sales = sales.reshape(len(months), -1).sum(axis=1)
+    seen = counts.reshape(len(months), -1).sum(axis=1) > 0
+    return pd.Series(sales[seen], index=pd.Index(months[seen], name="year_month"), name="sales")
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def compute_aggregates(_df, date_range, cats, regions, payments, prod_col):
+    """KPIs and per-section sales sums for one filter selection.
+
+    Cached on the (sorted) filter tuples only; _df is the prepared dataset and
+    is not hashed, so repeated selections skip both the mask and the groupbys.
+    The row mask is returned bit-packed (None when every row is selected) for
+    the sections that plot rows rather than sums.
+    """
+    mask = key_mask(_df, cats, regions, payments)
+    dates = date_mask(_df, date_range)
+    monthly = None
+    if dates is None or dates.all():
+        # no effective date filter: slice the precomputed month cube
+        monthly = monthly_from_cube(_df, {"category": cats, "region": regions, "payment_method": payments})
+    else:
+        mask &= dates
+    sub = _df if mask.all() else _df.loc[mask]
+    if monthly is None:
+        monthly = sub.groupby("year_month", sort=True)["sales"].sum().drop(MISSING_MONTH, errors="ignore")
+    unique_customers = count_unique(sub["customer_id"]) if "customer_id" in sub.columns else 0
+    total_sales = float(sub["sales"].to_numpy().sum(dtype=np.float64))
+    aggs = {
+        "kpis": (total_sales, total_sales / len(sub) if len(sub) > 0 else 0, unique_customers),
+        "monthly": monthly,
+        "has_dates": bool(sub["order_date"].notna().any()),
+        "mask": None if sub is _df else np.packbits(mask),
+    }
+    for key in ("category", "payment_method"):
+        if key in sub.columns:
+            aggs[key] = safe_groupby_sum(sub, key, "sales")
+    for key in ("customer_id", prod_col):
+        if key and key in sub.columns:
+            aggs[key] = top_sales(sub, key, 10)
+    return aggs
+
+@st.cache_resource(show_spinner=False)
+def load(path="ecommerce_dataset.csv"):
+    """Load and fully prepare the dataset once per process.
+
+    Returns (df, detected_columns). df is shared across reruns and sessions,
+    so nothing downstream may modify it in place.
+    """
+    # load_df already derived order_date (NaT when no date column was found)
+    df = load_df(path)
+    detected = df.attrs.get("detected_columns", list(df.columns))
+    # compute Sales
+    df = compute_sales(df)
+    # add int32 month key for monthly grouping (labels are built only at plot time)
+    df["year_month"] = month_key(df["order_date"])
+    # drop source columns nothing below reads (e.g. the raw date or order_total field)
+    df = df.drop(columns=[c for c in df.columns if c not in DASHBOARD_COLUMNS])
+    return df, detected
 
 # ---------- Load & prepare data ----------
 st.sidebar.header("Data & Filters")
+warm_sum_engine()
 
 try:
-    df = load_df("ecommerce_dataset.csv")
+    df, detected_columns = load("ecommerce_dataset.csv")
 except FileNotFoundError:
     st.error("Could not find 'ecommerce_dataset.csv' in the app folder. Upload it or place it next to this script.")
     st.stop()
@@ -87,17 +478,7 @@ except Exception as e:
 
 # show user the detected columns
 st.sidebar.markdown("**Detected columns:**")
-st.sidebar.write(list(df.columns))
-
-# ensure order_date column exists (detect common names)
-date_candidates = ["order_date", "order date", "date", "orderdate"]
-df = safe_to_datetime(df, date_candidates, new_col="order_date")
-
-# compute Sales
-df = compute_sales(df)
-
-# add YearMonth for monthly grouping (string for plotting)
-df["yearmonth"] = df["order_date"].dt.to_period("M").astype(str)
+st.sidebar.write(detected_columns)
 
 # Sidebar filters (only show filters for columns present)
 with st.sidebar.form("filters"):
@@ -129,29 +510,23 @@ with st.sidebar.form("filters"):
 
     submit = st.form_submit_button("Apply filters")
 
-# Apply filters to working df copy
-df_work = df.copy()
-if date_range and isinstance(date_range, (list, tuple)) and len(date_range) == 2:
-    start, end = date_range
-    # convert to datetime
-    start = pd.to_datetime(start)
-    end = pd.to_datetime(end)
-    df_work = df_work[(df_work["order_date"] >= start) & (df_work["order_date"] <= end)]
-
-if cats:
-    df_work = df_work[df_work["category"].isin(cats)]
-if regions:
-    df_work = df_work[df_work["region"].isin(regions)]
-if payments:
-    df_work = df_work[df_work["payment_method"].isin(payments)]
+# Normalize the selection into hashable, order-independent cache keys
+date_range = tuple(date_range) if isinstance(date_range, (list, tuple)) else date_range
+cats, regions, payments = tuple(sorted(cats)), tuple(sorted(regions)), tuple(sorted(payments))
+
+# ---------- Shared aggregations ----------
+# If product name not available, use product_id
+prod_col = "product_id" if "product_id" in df.columns else ("productname" if "productname" in df.columns else None)
+
+# KPIs, groupbys and the filter mask, cached per filter selection; the row-level
+# sections below copy only the rows and columns they plot
+aggs = compute_aggregates(df, date_range, cats, regions, payments, prod_col)
 
 # ---------- Top-level KPIs ----------
 st.title("📊 E-Commerce Data Analysis Dashboard (Converted from EDA.html)")
 st.markdown("A robust Streamlit version that recreates the charts & analyses from your uploaded EDA.")
 
-total_sales = df_work["sales"].sum()
-avg_order_value = df_work["sales"].mean() if len(df_work) > 0 else 0
-unique_customers = df_work["customer_id"].nunique() if "customer_id" in df_work.columns else 0
+total_sales, avg_order_value, unique_customers = aggs["kpis"]
 
 k1, k2, k3 = st.columns([1.5,1.5,1])
 k1.metric("Total Sales", f"${total_sales:,.2f}")
@@ -161,91 +536,84 @@ k3.metric("Unique Customers", f"{unique_customers}")
 st.markdown("---")
 
 # ---------- Sales by Category (bar) ----------
-if "category" in df_work.columns:
+if "category" in df.columns:
     st.subheader("🛒 Sales by Category")
-    category_sales = safe_groupby_sum(df_work, "category", "sales").sort_values("sales", ascending=False)
+    category_sales = aggs["category"].sort_values(ascending=False).reset_index()
     if not category_sales.empty:
-        fig_cat = px.bar(category_sales, x="category", y="sales",
-                         title="Sales by Category",
-                         text_auto=True, color="category",
-                         color_discrete_sequence=px.colors.sequential.Tealgrn)
-        fig_cat.update_layout(showlegend=False, yaxis_title="Sales")
-        st.plotly_chart(fig_cat, use_container_width=True)
+        plot_cached("bar", category_sales, dict(showlegend=False, yaxis_title="Sales"),
+                    x="category", y="sales",
+                    title="Sales by Category",
+                    text_auto=True, color="category",
+                    color_discrete_sequence=px.colors.sequential.Tealgrn)
     else:
         st.info("No category sales to display for current filters.")
 else:
     st.info("Column 'category' not found in dataset; skipping Sales by Category chart.")
 
 # ---------- Sales by Payment Method (bar) ----------
-if "payment_method" in df_work.columns:
+if "payment_method" in df.columns:
     st.subheader("💳 Sales by Payment Method")
-    pm_sales = safe_groupby_sum(df_work, "payment_method", "sales").sort_values("sales", ascending=False)
+    pm_sales = aggs["payment_method"].sort_values(ascending=False).reset_index()
     if not pm_sales.empty:
-        fig_pm = px.bar(pm_sales, x="payment_method", y="sales", text_auto=True,
-                        title="Sales by Payment Method")
-        fig_pm.update_layout(xaxis_title="Payment Method", yaxis_title="Sales", showlegend=False)
-        st.plotly_chart(fig_pm, use_container_width=True)
+        plot_cached("bar", pm_sales, dict(xaxis_title="Payment Method", yaxis_title="Sales", showlegend=False),
+                    x="payment_method", y="sales", text_auto=True,
+                    title="Sales by Payment Method")
     else:
         st.info("No payment method sales to display for current filters.")
 else:
     st.info("Column 'payment_method' not found; skipping Payment Method chart.")
 
 # ---------- Monthly Sales Trend (line) ----------
-if df_work["order_date"].notna().any():
+if aggs["has_dates"]:
     st.subheader("📈 Monthly Sales Trend")
-    monthly_sales = df_work.groupby(df_work["order_date"].dt.to_period("M"))["sales"].sum().reset_index()
-    monthly_sales["order_date"] = monthly_sales["order_date"].astype(str)
-    monthly_sales = monthly_sales.sort_values("order_date")
+    monthly_sales = aggs["monthly"].reset_index()
+    monthly_sales["order_date"] = month_label(monthly_sales["year_month"])
     if not monthly_sales.empty:
-        fig_month = px.line(monthly_sales, x="order_date", y="sales",
-                            title="Monthly Sales Trend", markers=True)
-        fig_month.update_layout(xaxis_title="Year-Month", yaxis_title="Sales")
-        st.plotly_chart(fig_month, use_container_width=True)
+        plot_cached("line", monthly_sales, dict(xaxis_title="Year-Month", yaxis_title="Sales"),
+                    x="order_date", y="sales",
+                    title="Monthly Sales Trend", markers=True)
     else:
         st.info("No monthly sales to display with current filters.")
 else:
     st.info("No valid order_date values found; skipping Monthly Sales Trend.")
 
 # ---------- Top 10 Customers ----------
-if "customer_id" in df_work.columns:
+if "customer_id" in df.columns:
     st.subheader("👥 Top 10 Customers by Sales")
-    top_customers = df_work.groupby("customer_id")["sales"].sum().nlargest(10).reset_index()
+    top_customers = aggs["customer_id"]
     if not top_customers.empty:
-        fig_cust = px.bar(top_customers, x="customer_id", y="sales", title="Top 10 Customers",
-                          text_auto=True, color="sales", color_continuous_scale="Viridis")
-        fig_cust.update_layout(xaxis_title="Customer ID", yaxis_title="Sales", showlegend=False)
-        st.plotly_chart(fig_cust, use_container_width=True)
+        plot_cached("bar", top_customers, dict(xaxis_title="Customer ID", yaxis_title="Sales", showlegend=False),
+                    x="customer_id", y="sales", title="Top 10 Customers",
+                    text_auto=True, color="sales", color_continuous_scale="Viridis")
     else:
         st.info("No customer sales to show.")
 else:
     st.info("Column 'customer_id' not found; skipping Top Customers chart.")
 
 # ---------- Top 10 Products ----------
-# If product name not available, use product_id
-prod_col = "product_id" if "product_id" in df_work.columns else ("productname" if "productname" in df_work.columns else None)
 if prod_col:
     st.subheader("📦 Top 10 Products by Sales")
-    top_products = df_work.groupby(prod_col)["sales"].sum().nlargest(10).reset_index()
+    top_products = aggs[prod_col]
     if not top_products.empty:
-        fig_prod = px.bar(top_products, x=prod_col, y="sales",
-                          title="Top 10 Products by Sales", text_auto=True,
-                          color="sales", color_continuous_scale="Blues")
-        fig_prod.update_layout(xaxis_title=prod_col, yaxis_title="Sales", showlegend=False)
-        st.plotly_chart(fig_prod, use_container_width=True)
+        plot_cached("bar", top_products, dict(xaxis_title=prod_col, yaxis_title="Sales", showlegend=False),
+                    x=prod_col, y="sales",
+                    title="Top 10 Products by Sales", text_auto=True,
+                    color="sales", color_continuous_scale="Blues")
     else:
         st.info("No product sales to display.")
 else:
     st.info("No product identifier column found; skipping Top Products chart.")
 
 # ---------- Category vs Region Heatmap (if present) ----------
-if ("category" in df_work.columns) and ("region" in df_work.columns):
+if ("category" in df.columns) and ("region" in df.columns):
     st.subheader("🗺️ Sales by Category and Region (Heatmap)")
-    pivot = df_work.pivot_table(values="sales", index="category", columns="region", aggfunc="sum", fill_value=0)
-    if not pivot.empty:
+    heat_rows = filtered_rows(df, aggs["mask"], ["category", "region", "sales"])
+    heat, heat_cats, heat_regions = code_crosstab(heat_rows, "category", "region", "sales")
+    if heat.size:
         fig_heat = go.Figure(data=go.Heatmap(
-            z=pivot.values,
-            x=list(pivot.columns),
-            y=list(pivot.index),
+            z=heat,
+            x=list(heat_regions),
+            y=list(heat_cats),
             hovertemplate="Region=%{x}<br>Category=%{y}<br>Sales=%{z}<extra></extra>"
         ))
         fig_heat.update_layout(title="Category vs Region Sales Heatmap", xaxis_title="Region", yaxis_title="Category")
@@ -256,31 +624,31 @@ else:
     st.info("Need both 'category' and 'region' to compute Category vs Region heatmap.")
 
 # ---------- Discount analysis ----------
-if "discount" in df_work.columns:
+if "discount" in df.columns:
     st.subheader("🏷️ Discount vs Sales")
+    disc_rows = filtered_rows(df, aggs["mask"], ["discount", "sales"])
     # ensure discount as fraction
-    disc = pd.to_numeric(df_work["discount"], errors="coerce").fillna(0)
+    disc = pd.to_numeric(disc_rows["discount"], errors="coerce").fillna(0)
     if disc.max() > 1:
         disc = disc / 100
-    df_work["_discount_frac"] = disc
-    # aggregate by rounded discount bins
-    df_work["_disc_bin"] = (df_work["_discount_frac"] * 100).round().astype(int)
-    disc_agg = df_work.groupby("_disc_bin")["sales"].sum().reset_index().sort_values("_disc_bin")
+    # aggregate by rounded discount bins (kept out of disc_rows so df is never mutated)
+    disc_bin = (disc * 100).round().astype(int).rename("_disc_bin")
+    disc_agg = disc_rows["sales"].groupby(disc_bin, sort=False).sum().reset_index().sort_values("_disc_bin")
     if not disc_agg.empty:
-        fig_disc = px.bar(disc_agg, x="_disc_bin", y="sales", title="Sales by Discount (%) bin",
-                          labels={"_disc_bin":"Discount (%)", "sales":"Sales"}, text_auto=True)
-        st.plotly_chart(fig_disc, use_container_width=True)
+        plot_cached("bar", disc_agg, x="_disc_bin", y="sales", title="Sales by Discount (%) bin",
+                    labels={"_disc_bin":"Discount (%)", "sales":"Sales"}, text_auto=True)
     else:
         st.info("No discount analysis data available.")
 else:
     st.info("Column 'discount' not found; skipping discount analysis.")
 
 # ---------- Quantity distribution ----------
-if "quantity" in df_work.columns:
+if "quantity" in df.columns:
     st.subheader("🔢 Quantity distribution (orders)")
-    qty = pd.to_numeric(df_work["quantity"], errors="coerce").fillna(0)
+    qty_rows = filtered_rows(df, aggs["mask"], ["quantity"])
+    qty = pd.to_numeric(qty_rows["quantity"], errors="coerce").fillna(0)
     if len(qty) > 0:
-        fig_qty = px.histogram(df_work, x="quantity", nbins=30, title="Order quantity distribution")
+        fig_qty = px.histogram(qty_rows, x="quantity", nbins=30, title="Order quantity distribution")
         st.plotly_chart(fig_qty, use_container_width=True)
     else:
         st.info("No quantity data to plot.")
@@ -289,5 +657,5 @@ else:
 
 # ---------- Raw data preview ----------
 with st.expander("Show data (first 200 rows)"):
-    st.write(df_work.head(200))
+    st.write(filtered_rows(df, aggs["mask"], limit=200))
 